@@ -1,21 +1,26 @@
-import os.path as op
+import os
+import sys
+import io
 from pathlib import Path
 import typing as ty
 import tempfile
 import logging
 import hashlib
+import mmap
 import json
 import re
-from operator import attrgetter
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from zipfile import ZipFile, BadZipfile
 import attrs
+import requests.adapters
 import xnat.session
 from fileformats.core import FileSet, Field
 from fileformats.medimage import DicomSeries
 from fileformats.core.exceptions import FormatRecognitionError
 from frametree.core.utils import (
-    path2label,
-    label2path,
+    path2label as _path2label,
+    label2path as _label2path,
 )
 from frametree.core.store.remote import (
     RemoteStore,
@@ -31,12 +36,93 @@ from frametree.core.tree import DataTree
 from frametree.core.entry import DataEntry
 from frametree.common import Clinical
 
+orjson: ty.Any
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def json_dumps(obj: ty.Any) -> bytes:
+    """Serialises an object to compact JSON, using orjson if it is installed"""
+    if orjson is not None:
+        dumped: bytes = orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+        return dumped
+    return json.dumps(obj, separators=(",", ":")).encode()
+
+
+json_loads = orjson.loads if orjson is not None else json.loads
+
 
 logger = logging.getLogger("frametree")
 
 tag_parse_re = re.compile(r"\((\d+),(\d+)\)")
 
-RELEVANT_DICOM_TAG_TYPES = set(("UI", "CS", "DA", "TM", "SH", "LO", "PN", "ST", "AS"))
+RELEVANT_DICOM_TAG_TYPES = frozenset(
+    ("UI", "CS", "DA", "TM", "SH", "LO", "PN", "ST", "AS")
+)
+
+
+def convert_dicom_value(val: str, vr: str) -> ty.Any:
+    """Converts the string value of a tag returned by the dicomdump service to a
+    Python value based on its value representation"""
+    if vr == "TM":
+        try:
+            return float(val)
+        except ValueError:
+            pass
+    elif vr == "CS":
+        return val.split("\\")
+    return val
+
+
+@functools.lru_cache(maxsize=4096)
+def path2label(path: str) -> str:
+    """Memoised ``path2label``, as the same entry paths recur in every row"""
+    return _path2label(path)  # type: ignore[no-any-return]
+
+
+@functools.lru_cache(maxsize=4096)
+def label2path(label: str) -> str:
+    """Memoised ``label2path``, as the same entry labels recur in every row"""
+    return _label2path(label)  # type: ignore[no-any-return]
+
+
+class LazyChecksums(ty.Mapping[str, str]):
+    """Checksums of the files in an XNAT resource that are only downloaded the first
+    time they are accessed, as they are only needed to check whether a previously
+    cached copy of the resource is stale
+
+    Parameters
+    ----------
+    store : Xnat
+        the store to download the checksums from
+    uri : str
+        the URI of the resource
+    """
+
+    def __init__(self, store: "Xnat", uri: str):
+        self._store = store
+        self._uri = uri
+        self._checksums: ty.Optional[ty.Dict[str, str]] = None
+
+    @property
+    def checksums(self) -> ty.Dict[str, str]:
+        if self._checksums is None:
+            self._checksums = self._store.get_checksums(self._uri)
+        return self._checksums
+
+    def __getitem__(self, key: str) -> str:
+        return self.checksums[key]
+
+    def __iter__(self) -> ty.Iterator[str]:
+        return iter(self.checksums)
+
+    def __len__(self) -> int:
+        return len(self.checksums)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self._uri!r})"
 
 
 @attrs.define
@@ -69,6 +155,21 @@ class Xnat(RemoteStore):
     DEFAULT_HIERARCHY = ("subject", "session")
     # DEFAULT_ID_PATTERNS = (("visit", "session:order"),)
     PROV_RESOURCE = "PROVENANCE"
+    MAX_CONCURRENT_REQUESTS = 16
+    ZIP_SPOOL_SIZE = 64 * 1024 * 1024  # bytes
+    DICOM_HEADER_CACHE = "dicom-headers"
+    # Columns of the imaging session listing used to populate the tree. Those of
+    # xnat:imageSessionData aren't REST shortcuts of the experiment listing, so they
+    # are selected by their XSI path (and returned under lower-cased names)
+    SESSION_LISTING_COLUMNS = (
+        "label",
+        "subject_label",
+        "date",
+        "time",
+        "visit_id",
+        "xnat:imageSessionData/modality",
+        "xnat:imageSessionData/age",
+    )
 
     #############################
     # Store implementations #
@@ -84,26 +185,47 @@ class Xnat(RemoteStore):
             The tree to populate with nodes via the ``DataTree.add_leaf`` method
         """
         with self.connection:
-            # Get all "leaf" nodes, i.e. XNAT imaging session objects
-            xproject = self.connection.projects[tree.dataset_id]
-            subjects = sorted(xproject.subjects.values(), key=attrgetter("label"))
-            for xsubject in subjects:
-                # Sort sessions into a logical order
-                xsessions = sorted(
-                    xsubject.experiments.values(),
-                    key=lambda x: (x.date, x.time, x.label),
-                )
-                for xsess in xsessions:
-                    date = xsess.date.strftime("%Y%m%d") if xsess.date else None
-                    metadata = {
-                        "session": {
-                            "date": date,
-                            "visit_id": xsess.visit_id,
-                            "age": xsess.age,
-                            "modality": xsess.modality,
-                        }
+            # Get all "leaf" nodes, i.e. XNAT imaging session objects, along with the
+            # metadata of each session from a single listing of the project's
+            # experiments, instead of traversing the lazily-loaded XnatPy objects
+            response = self.connection.get(
+                f"/data/projects/{tree.dataset_id}/experiments",
+                format="json",
+                query={
+                    "xsiType": "xnat:imageSessionData",
+                    "columns": ",".join(self.SESSION_LISTING_COLUMNS),
+                },
+                accepted_status=[200, 404],
+            )
+        if response.status_code == 404:
+            raise KeyError(
+                f"Could not find project '{tree.dataset_id}' on {self.server}"
+            )
+        by_subject: ty.Dict[str, ty.List[ty.Dict[str, ty.Any]]] = {}
+        for xsess in json_loads(response.content)["ResultSet"]["Result"]:
+            # Empty values are returned as empty strings
+            fields: ty.Dict[str, ty.Any] = {
+                k.lower(): (v if v != "" else None) for k, v in xsess.items()
+            }
+            by_subject.setdefault(fields["subject_label"], []).append(fields)
+        for subject_label in sorted(by_subject):
+            # Sort sessions into a logical order
+            sessions = sorted(
+                by_subject[subject_label],
+                key=lambda s: (s.get("date") or "", s.get("time") or "", s["label"]),
+            )
+            for fields in sessions:
+                date = fields.get("date")
+                age = fields.get("xnat:imagesessiondata/age")
+                metadata = {
+                    "session": {
+                        "date": date.replace("-", "") if date else None,
+                        "visit_id": fields.get("visit_id"),
+                        "age": float(age) if age is not None else None,
+                        "modality": fields.get("xnat:imagesessiondata/modality"),
                     }
-                    tree.add_leaf([xsubject.label, xsess.label], metadata=metadata)
+                }
+                tree.add_leaf([subject_label, fields["label"]], metadata=metadata)
 
     def populate_row(self, row: DataRow) -> None:
         """
@@ -117,44 +239,79 @@ class Xnat(RemoteStore):
         """
         with self.connection:
             xrow = self.get_xrow(row)
-            # Add scans, fields and resources to data row
             try:
                 xscans = xrow.scans
             except AttributeError:
-                pass  # A subject or project row
+                xscans = {}  # A subject or project row
+                scan_resources_data: ty.Dict[str, ty.List[ty.Dict[str, ty.Any]]] = {}
             else:
+                # The resources of all scans are read from the full JSON of the session,
+                # which is a single request, instead of listing each scan's resources
+                scan_resources_data = {
+                    s["data_fields"]["ID"]: [
+                        r["data_fields"] for r in self._child_items(s, "file")
+                    ]
+                    for s in self._child_items(xrow.fulldata, "scans/scan")
+                }
+            # The dicomdump requests for each scan are independent of each other, so
+            # they are issued concurrently to overlap their latencies (and that of
+            # listing the row's resources)
+            with ThreadPoolExecutor(max_workers=self.MAX_CONCURRENT_REQUESTS) as pool:
+                scan_resources = []
                 for xscan in xscans.values():
-                    for xresource in xscan.resources.values():
-                        uri = self._get_resource_uri(xresource)
-                        if xresource.label in ("DICOM", "secondary"):
+                    # The dicomdump service is queried by scan, so the header is
+                    # shared between all the DICOM resources of the scan
+                    scan_header = None
+                    resources_data = scan_resources_data.get(xscan.id, [])
+                    for resource_data in resources_data:
+                        label = resource_data["label"]
+                        uri = f"{xscan.uri}/resources/{label}"
+                        if label in ("DICOM", "secondary"):
                             datatype = DicomSeries
-                            item_metadata = self.get_dicom_header(uri)
+                            if scan_header is None:
+                                # The records of the scan's resources (IDs, file
+                                # counts and sizes) change with its files, so they
+                                # are used to invalidate the cached header
+                                scan_header = pool.submit(
+                                    self._get_dicom_header,
+                                    uri,
+                                    version=json_dumps(resources_data).decode(),
+                                )
+                            header = scan_header
                         else:
                             datatype = FileSet
-                            item_metadata = {}
-                        row.add_entry(
-                            path=f"{xscan.type}/{xresource.label}",
-                            datatype=datatype,
-                            order=xscan.id,
-                            quality=xscan.quality,
-                            item_metadata=item_metadata,
-                            uri=uri,
-                        )
+                            header = None
+                        scan_resources.append((xscan, label, uri, datatype, header))
+                row_resources = []
+                for xresource in xrow.resources.values():
+                    if xresource.label == self.METADATA_RESOURCE:
+                        continue
+                    uri = self._get_resource_uri(xresource)
+                    try:
+                        datatype = FileSet.from_mime(xresource.format)
+                    except FormatRecognitionError:
+                        datatype = FileSet
+                    row_resources.append((xresource, uri, datatype))
+            # Add scans, fields and resources to data row
+            for xscan, label, uri, datatype, header in scan_resources:
+                row.add_entry(
+                    path=f"{xscan.type}/{label}",
+                    datatype=datatype,
+                    order=xscan.id,
+                    quality=xscan.quality,
+                    item_metadata=header.result() if header is not None else {},
+                    uri=uri,
+                )
             for field_id in xrow.fields:
                 row.add_entry(path=label2path(field_id), datatype=Field, uri=None)
-            for xresource in xrow.resources.values():
-                if xresource.label == self.METADATA_RESOURCE:
-                    continue
-                uri = self._get_resource_uri(xresource)
-                try:
-                    datatype = FileSet.from_mime(xresource.format)
-                except FormatRecognitionError:
-                    datatype = FileSet
+            for xresource, uri, datatype in row_resources:
+                # Checksums are only needed to check whether a cached copy is stale, so
+                # they aren't downloaded until they are accessed
                 row.add_entry(
                     path=label2path(xresource.label),
                     datatype=datatype,
                     uri=uri,
-                    checksums=self.get_checksums(uri),
+                    checksums=LazyChecksums(self, uri),
                 )
 
     def save_frameset_definition(
@@ -175,7 +332,7 @@ class Xnat(RemoteStore):
             definitions for the same directory/project
         """
         with self.connection:
-            xproject = self.connection.projects[dataset_id]
+            xproject = self.get_xproject(dataset_id)
             try:
                 xresource = xproject.resources[self.METADATA_RESOURCE]
             except KeyError:
@@ -183,10 +340,11 @@ class Xnat(RemoteStore):
                 xresource = self.connection.classes.ResourceCatalog(
                     parent=xproject, label=self.METADATA_RESOURCE, format="json"
                 )
-            definition_file = Path(tempfile.mkdtemp()) / str(name + ".json")
-            with open(definition_file, "w") as f:
-                json.dump(definition, f, indent="    ")
-            xresource.upload(str(definition_file), name + ".json", overwrite=True)
+            xresource.upload_data(
+                json_dumps(definition),
+                name + ".json",
+                overwrite=True,
+            )
 
     def load_frameset_definition(
         self, dataset_id: str, name: str
@@ -207,26 +365,19 @@ class Xnat(RemoteStore):
             A dct FrameSet object that was saved in the data store
         """
         with self.connection:
-            xproject = self.connection.projects[dataset_id]
+            xproject = self.get_xproject(dataset_id)
             try:
                 xresource = xproject.resources[self.METADATA_RESOURCE]
             except KeyError:
                 definition = None
             else:
-                download_dir = Path(tempfile.mkdtemp())
-                xresource.download_dir(download_dir)
-                fpath = (
-                    download_dir
-                    / dataset_id
-                    / "resources"
-                    / self.METADATA_RESOURCE
-                    / "files"
-                    / (name + ".json")
-                )
-                print(fpath)
-                if fpath.exists():
-                    with open(fpath) as f:
-                        definition = json.load(f)
+                # Request the single definition file directly instead of downloading
+                # the whole resource to disk
+                uri = f"{self._get_resource_uri(xresource)}/files/{name}.json"
+                logger.debug("Loading frameset definition from %s", uri)
+                response = self.connection.get(uri, accepted_status=[200, 404])
+                if response.status_code == 200:
+                    definition = json_loads(response.content)
                 else:
                     definition = None
         return definition
@@ -248,7 +399,21 @@ class Xnat(RemoteStore):
             kwargs["user"] = self.user
         if self.password is not None:
             kwargs["password"] = self.password
-        return xnat.connect(server=self.server, verify=self.verify_ssl, **kwargs)
+        session = xnat.connect(server=self.server, verify=self.verify_ssl, **kwargs)
+        # Size the connection pool so requests fanned out over worker threads
+        # reuse connections instead of churning through requests' default of 10
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=self.MAX_CONCURRENT_REQUESTS,
+            pool_maxsize=self.MAX_CONCURRENT_REQUESTS,
+        )
+        session.interface.mount("https://", adapter)
+        session.interface.mount("http://", adapter)
+        # XnatPy objects are bound to the session they are loaded with, so they are
+        # cached on the session itself instead of on the store, whose attributes are
+        # serialised and used to construct copies of it
+        session.frametree_xrows = {}
+        session.frametree_xprojects = {}
+        return session
 
     def disconnect(self, session: xnat.XNATSession) -> None:
         """
@@ -276,9 +441,11 @@ class Xnat(RemoteStore):
         xresource, _, cache_path = self._provenance_location(
             entry, create_resource=True
         )
-        with open(cache_path, "w") as f:
-            json.dump(provenance, f, indent="  ")
-        xresource.upload(str(cache_path), cache_path.name)
+        # Serialise once and upload from memory, writing the same bytes to the cache
+        provenance_bytes = json_dumps(provenance)
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        cache_path.write_bytes(provenance_bytes)
+        xresource.upload_data(provenance_bytes, cache_path.name)
 
     def get_provenance(self, entry: DataEntry) -> ty.Dict[str, ty.Any]:
         """Stores provenance information for a given data item in the store
@@ -298,11 +465,13 @@ class Xnat(RemoteStore):
             xresource, uri, cache_path = self._provenance_location(entry)
         except KeyError:
             return {}  # Provenance doesn't exist on server
-        with open(cache_path, "wb") as f:
-            xresource.xnat_session.download_stream(uri, f)
-        with open(cache_path) as f:
-            provenance = json.load(f)
-        return provenance
+        buffer = io.BytesIO()
+        xresource.xnat_session.download_stream(uri, buffer)
+        provenance_bytes = buffer.getvalue()
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        cache_path.write_bytes(provenance_bytes)
+        provenance = json_loads(provenance_bytes)
+        return provenance  # type: ignore[no-any-return]
 
     def create_data_tree(
         self,
@@ -362,22 +531,48 @@ class Xnat(RemoteStore):
         output_dir : Path
             a directory containing the downloaded files/directories and nothing else
         """
-        with self.connection:
-            # Download resource to zip file
-            zip_path = op.join(download_dir, "download.zip")
-            with open(zip_path, "wb") as f:
+        files_dir = download_dir / "files"
+        # Download resource to a zip archive that is held in memory unless it is
+        # larger than ZIP_SPOOL_SIZE, in which case it is spilled to the download dir
+        zip_buffer: ty.IO[bytes]
+        if sys.version_info >= (3, 11):
+            zip_buffer = tempfile.SpooledTemporaryFile(
+                max_size=self.ZIP_SPOOL_SIZE, dir=str(download_dir)
+            )
+        else:
+            # ZipFile requires a seekable() method, which SpooledTemporaryFile only
+            # provides from Python 3.11
+            zip_buffer = tempfile.TemporaryFile(dir=str(download_dir))
+        with zip_buffer:
+            with self.connection:
                 self.connection.download_stream(
-                    entry.uri + "/files", f, format="zip", verbose=True
+                    entry.uri + "/files", zip_buffer, format="zip", verbose=True
                 )
-        # Extract downloaded zip file
-        expanded_dir = download_dir / "expanded"
-        try:
-            with ZipFile(zip_path) as zip_file:
-                zip_file.extractall(expanded_dir)
-        except BadZipfile as e:
-            raise FrameTreeError(f"Could not unzip file '{zip_path}' ({e})") from e
-        data_path = next(expanded_dir.glob("**/files"))
-        return data_path
+            zip_buffer.seek(0)
+            # Extract the members within the "files" directory of the XNAT archive
+            # layout straight into the output directory, skipping the rest
+            found_files = False
+            try:
+                with ZipFile(zip_buffer) as zip_file:
+                    for member in zip_file.infolist():
+                        _, sep, rel_path = member.filename.partition("/files/")
+                        if not sep:
+                            continue
+                        found_files = True
+                        if rel_path:
+                            member.filename = rel_path
+                            zip_file.extract(member, files_dir)
+            except BadZipfile as e:
+                raise FrameTreeError(
+                    f"Could not unzip archive downloaded from '{entry.uri}' ({e})"
+                ) from e
+        if not found_files:
+            raise FrameTreeError(
+                f"Could not find 'files' directory in archive downloaded from "
+                f"'{entry.uri}'"
+            )
+        files_dir.mkdir(exist_ok=True)
+        return files_dir
 
     def upload_files(self, cache_path: Path, entry: DataEntry) -> None:
         """Upload all files contained within `input_dir` to the specified entry in the
@@ -438,7 +633,6 @@ class Xnat(RemoteStore):
             xrow = self.get_xrow(entry.row)
             field_name = path2label(entry.path)
             if not entry.is_derivative and field_name in xrow.fields:
-                field_name
                 raise FrameTreeUsageError(
                     f"Refusing to overwrite non-derivative field {entry.path} in {xrow}"
                 )
@@ -533,16 +727,20 @@ class Xnat(RemoteStore):
                 "Can't retrieve checksums as URI has not been set for {}".format(uri)
             )
         with self.connection:
-            checksums = {
-                r["URI"]: r["digest"]
-                for r in self.connection.get_json(uri + "/files")["ResultSet"]["Result"]
-            }
-        # strip base URI to get relative paths of files within the resource
-        checksums = {
-            re.match(r".*/resources/\w+/files/(.*)$", u).group(1): c
-            for u, c in sorted(checksums.items())
-        }
-        return checksums
+            response = json_loads(
+                self.connection.get(uri + "/files", format="json").content
+            )
+            # strip base URI to get relative paths of files within the resource,
+            # sorting on the (shorter) relative paths rather than the full URIs
+            return dict(
+                sorted(
+                    (
+                        r["URI"].partition("/resources/")[2].partition("/files/")[2],
+                        r["digest"],
+                    )
+                    for r in response["ResultSet"]["Result"]
+                )
+            )
 
     def calculate_checksums(self, fileset: FileSet) -> ty.Dict[str, str]:
         """
@@ -555,7 +753,26 @@ class Xnat(RemoteStore):
         uri: str
             uri of the data item to download the checksums for
         """
-        return fileset.hash_files(crypto=hashlib.md5, relative_to=fileset.fspath.parent)
+        base_dir = fileset.fspath.parent.absolute()
+        fspaths: ty.List[Path] = []
+        for fspath in fileset.fspaths:
+            if fspath.is_dir():
+                fspaths.extend(
+                    Path(dpath) / fname
+                    for dpath, _, fnames in os.walk(fspath)
+                    for fname in fnames
+                )
+            else:
+                fspaths.append(fspath)
+        # Hashing releases the GIL, so the files can be hashed concurrently
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as pool:
+            digests = pool.map(self._md5_digest, fspaths)
+        return dict(
+            sorted(
+                (str(p.absolute().relative_to(base_dir)), d)
+                for p, d in zip(fspaths, digests)
+            )
+        )
 
     ##################
     # Helper methods #
@@ -571,8 +788,14 @@ class Xnat(RemoteStore):
         row : DataRow
             The row to get the corresponding XNAT row for
         """
+        key = (row.frameset.id, row.frequency, row.id)
         with self.connection:
-            xproject = self.connection.projects[row.frameset.id]
+            xrows = self.connection.frametree_xrows
+            try:
+                return xrows[key]
+            except KeyError:
+                pass
+            xproject = self.get_xproject(row.frameset.id)
             if row.frequency == Clinical.constant:
                 xrow = xproject
             elif row.frequency == Clinical.subject:
@@ -586,30 +809,31 @@ class Xnat(RemoteStore):
                 xrow = self.connection.classes.SubjectData(
                     label=self.make_row_name(row), parent=xproject
                 )
+            xrows[key] = xrow
             return xrow
 
-    def get_dicom_header(self, uri: str) -> ty.Dict[str, ty.Any]:
-        def convert(val: ty.Any, code: str) -> ty.Any:
-            if code == "TM":
-                try:
-                    val = float(val)
-                except ValueError:
-                    pass
-            elif code == "CS":
-                val = val.split("\\")
-            return val
+    def get_xproject(self, dataset_id: str) -> "xnat.classes.ProjectData":
+        """
+        Returns the XNAT project corresponding to the provided dataset ID
 
+        Parameters
+        ----------
+        dataset_id : str
+            The ID of the project to get
+        """
         with self.connection:
-            scan_uri = "/" + "/".join(uri.split("/")[2:-2])
-            response = self.connection.get(
-                "/REST/services/dicomdump?src=" + scan_uri
-            ).json()["ResultSet"]["Result"]
-        hdr = {
-            tag_parse_re.match(t["tag1"]).groups(): convert(t["value"], t["vr"])
-            for t in response
-            if (tag_parse_re.match(t["tag1"]) and t["vr"] in RELEVANT_DICOM_TAG_TYPES)
-        }
-        return hdr
+            xprojects = self.connection.frametree_xprojects
+            try:
+                return xprojects[dataset_id]
+            except KeyError:
+                pass
+            xproject = self.connection.projects[dataset_id]
+            xprojects[dataset_id] = xproject
+            return xproject
+
+    def get_dicom_header(self, uri: str) -> ty.Dict[ty.Tuple[str, ...], ty.Any]:
+        with self.connection:
+            return self._get_dicom_header(uri)
 
     def make_row_name(self, row: DataRow) -> str:
         # Create a "subject" to hold the non-standard row (i.e. not
@@ -629,7 +853,6 @@ class Xnat(RemoteStore):
         fname = path2label(entry.path) + ".json"
         uri = f"{xrow.uri}/resources/{self.PROV_RESOURCE}/files/{fname}"
         cache_path = self.cache_path(uri)
-        cache_path.parent.mkdir(parents=True, exist_ok=True)
         try:
             xresource = xrow.resources[self.PROV_RESOURCE]
         except KeyError:
@@ -641,6 +864,91 @@ class Xnat(RemoteStore):
                 raise
         return xresource, uri, cache_path
 
+    # _get_dicom_header issues requests on the open session without entering the
+    # connection context, whose nesting counter isn't thread-safe, so it can be
+    # called from worker threads within a ``with self.connection`` block
+
+    def _get_dicom_header(
+        self, uri: str, version: ty.Optional[str] = None
+    ) -> ty.Dict[ty.Tuple[str, ...], ty.Any]:
+        """Downloads the DICOM header of a scan
+
+        Parameters
+        ----------
+        uri : str
+            the URI of a DICOM resource of the scan
+        version : str, optional
+            a token that changes whenever the files of the scan do (e.g. the
+            serialised records of its resources). If provided, the header is cached
+            on disk and only downloaded again when the token changes
+
+        Returns
+        -------
+        dict[tuple[str, ...], Any]
+            the relevant DICOM tags of the scan mapped to their values
+        """
+        scan_uri = "/" + "/".join(uri.split("/")[2:-2])
+        cache_path = (
+            self.cache_dir
+            / self.DICOM_HEADER_CACHE
+            / (hashlib.sha1((self.server + scan_uri).encode()).hexdigest() + ".json")
+        )
+        if version is not None and cache_path.exists():
+            cached = json_loads(cache_path.read_bytes())
+            if cached["version"] == version:
+                return {tuple(k): v for k, v in cached["header"]}
+        response = json_loads(
+            self.connection.get("/REST/services/dicomdump?src=" + scan_uri).content
+        )["ResultSet"]["Result"]
+        hdr: ty.Dict[ty.Tuple[str, ...], ty.Any] = {}
+        # Bind globals/attributes to locals as this loop runs over every tag
+        relevant_types = RELEVANT_DICOM_TAG_TYPES
+        match_tag = tag_parse_re.match
+        convert = convert_dicom_value
+        for t in response:
+            vr = t["vr"]
+            if vr not in relevant_types:
+                continue
+            match = match_tag(t["tag1"])
+            if match is None:
+                continue
+            hdr[match.groups()] = convert(t["value"], vr)
+        if version is None:
+            return hdr
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file and rename so concurrent readers never see a
+        # partially written header
+        with tempfile.NamedTemporaryFile(
+            dir=cache_path.parent, suffix=".tmp", delete=False
+        ) as f:
+            f.write(json_dumps({"version": version, "header": list(hdr.items())}))
+        os.replace(f.name, cache_path)
+        return hdr
+
+    @staticmethod
+    def _child_items(
+        data: ty.Dict[str, ty.Any], field: str
+    ) -> ty.List[ty.Dict[str, ty.Any]]:
+        """Returns the items of a child field in the full JSON data of an XNAT object"""
+        return next((c["items"] for c in data["children"] if c["field"] == field), [])
+
+    @staticmethod
+    def _md5_digest(fspath: Path) -> str:
+        """Calculates the MD5 digest of a file without copying its contents into
+        Python objects, using hashlib.file_digest where available (Python >= 3.11)
+        and memory-mapping the file otherwise"""
+        if not fspath.is_file():
+            # Broken symlink, hashed the same way as in FileSet.hash_files
+            return hashlib.md5(b"\x00").hexdigest()
+        with open(fspath, "rb") as f:
+            if sys.version_info >= (3, 11):
+                return hashlib.file_digest(f, "md5").hexdigest()
+            crypto = hashlib.md5()
+            if os.fstat(f.fileno()).st_size:  # empty files can't be memory-mapped
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    crypto.update(mapped)
+        return crypto.hexdigest()
+
     def _encrypt_credentials(self, serialised: ty.Dict[str, ty.Any]) -> None:
         with self.connection:
             (
@@ -655,9 +963,9 @@ class Xnat(RemoteStore):
         self._encrypt_credentials(dct)
         return dct  # type: ignore[no-any-return]
 
-    @classmethod
-    def _get_resource_uri(cls, xresource: "xnat.ResourceCatalog") -> str:
+    @staticmethod
+    def _get_resource_uri(xresource: "xnat.ResourceCatalog") -> str:
         """Replaces the resource ID with the resource label"""
-        return (  # type: ignore[no-any-return]
-            re.match(r"(.*/)[^/]+", xresource.uri).group(1) + xresource.label  # type: ignore[union-attr]
-        )
+        uri: str = xresource.uri
+        label: str = xresource.label
+        return uri[: uri.rfind("/") + 1] + label
@@ -9,16 +9,21 @@ import logging
 from pathlib import Path
 import attrs
 from fileformats.core import FileSet
-from frametree.core.utils import path2label
 from frametree.common import Clinical
 from frametree.core.axes import Axes
 from frametree.core.row import DataRow
 from frametree.core.entry import DataEntry
 from frametree.core.exceptions import FrameTreeNoDirectXnatMountException
-from .api import Xnat
+from .api import Xnat, path2label
 
 logger = logging.getLogger("frametree")
 
+archive_uri_re = re.compile(
+    r"/data/(?:archive/)?projects/[a-zA-Z0-9\-_]+/"
+    r"(?:subjects/[a-zA-Z0-9\-_]+/)?"
+    r"(?:experiments/[a-zA-Z0-9\-_]+/)?(?P<path>.*)$"
+)
+
 
 @attrs.define
 class XnatViaCS(Xnat):
@@ -114,18 +119,11 @@ class XnatViaCS(Xnat):
         if entry.is_derivative and self.internal_upload:
             # entry is in input mount
             resource_path = self.output_mount_fspath(entry)
-            fspaths = [
-                p
-                for p in resource_path.parent.iterdir()
-                if re.match("^" + resource_path.name + r"\b", p.name)
-            ]
+            name_re = re.compile("^" + resource_path.name + r"\b")
+            with os.scandir(resource_path.parent) as it:
+                fspaths = [Path(e.path) for e in it if name_re.match(e.name)]
         else:
-            match = re.match(
-                r"/data/(?:archive/)?projects/[a-zA-Z0-9\-_]+/"
-                r"(?:subjects/[a-zA-Z0-9\-_]+/)?"
-                r"(?:experiments/[a-zA-Z0-9\-_]+/)?(?P<path>.*)$",
-                entry.uri,
-            )
+            match = archive_uri_re.match(entry.uri)
             if match is None:
                 raise ValueError(f"Invalid URI in {self}: {entry.uri}")
             path = match.group("path")
@@ -137,18 +135,24 @@ class XnatViaCS(Xnat):
             assert (
                 resource_path.exists()
             ), f"Resource path {path} not found in {input_mount}: {list(input_mount.iterdir())}"  # noqa
-            fspaths = [
-                p
-                for p in resource_path.iterdir()
-                if not p.name.endswith("_catalog.xml")
-            ]
+            # Filter on the raw entry names so Path objects are only constructed for
+            # the files that are kept
+            with os.scandir(resource_path) as it:
+                fspaths = [
+                    Path(e.path) for e in it if not e.name.endswith("_catalog.xml")
+                ]
         return datatype(fspaths)  # type: ignore[no-any-return]
 
     def put_fileset(self, fileset: FileSet, entry: DataEntry) -> FileSet:
         if not (self.internal_upload and entry.is_derivative):
             return super().put_fileset(fileset, entry)  # type: ignore[no-any-return]
+        # Hard-link the outputs into the output mount where it is on the same file
+        # system as the work directory, instead of duplicating the file data. Falls
+        # back to a full copy otherwise. Symlinks aren't used as their targets
+        # won't exist after the container exits
         cached = fileset.copy(
             dest_dir=self.output_mount,
+            mode=fileset.CopyMode.hardlink_or_copy,
             make_dirs=True,
             new_stem=entry.path.split("/")[-1].split("@")[0],
             trim=False,
@@ -185,11 +189,12 @@ class XnatViaCS(Xnat):
             self.row_frequency == Clinical.constant
             and row.frequency == Clinical.session
         ):
-            arc_dirs = [
-                d
-                for d in self.input_mount.iterdir()
-                if d.is_dir() and d.name.startswith("arc")
-            ]
+            # DirEntry.is_dir() uses the file type returned with the listing so
+            # doesn't need a separate stat per entry
+            with os.scandir(self.input_mount) as it:
+                arc_dirs = [
+                    Path(d.path) for d in it if d.name.startswith("arc") and d.is_dir()
+                ]
             for arc_dir in arc_dirs:
                 session_dir: Path = arc_dir / row.id
                 if session_dir.exists():
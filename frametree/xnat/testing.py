@@ -28,27 +28,31 @@ class TestXnatDatasetBlueprint(TestDatasetBlueprint):  # type: ignore[misc]
 
     # Overwrite attributes in core blueprint class
     axes: type = Clinical
-    hierarchy: ty.List[Axes] = ["subject", "session"]
+    hierarchy: ty.List[Axes] = attrs.field(factory=lambda: ["subject", "session"])
     filesets: ty.Optional[ty.List[str]] = None
 
     def make_entries(self, row: DataRow, source_data: ty.Optional[Path] = None) -> None:
         logger.debug("Making entries in %s row: %s", row, self.scans)
         xrow = row.frameset.store.get_xrow(row)
         xclasses = xrow.xnat_session.classes
-        for scan_id, scan_bp in enumerate(self.scans, start=1):
-            xscan = xclasses.MrScanData(id=scan_id, type=scan_bp.name, parent=xrow)
-            for resource_bp in scan_bp.resources:
-                tmp_dir = Path(tempfile.mkdtemp())
-                # Create the resource
-                xresource = xscan.create_resource(resource_bp.path)
-                # Create the dummy files
-                item = resource_bp.make_item(
-                    source_data=source_data,
-                    source_fallback=True,
-                    escape_source_name=False,
-                )
-                item.copy(tmp_dir)
-                xresource.upload_dir(tmp_dir)
+        with tempfile.TemporaryDirectory() as tmp_root:
+            for scan_id, scan_bp in enumerate(self.scans, start=1):
+                xscan = xclasses.MrScanData(id=scan_id, type=scan_bp.name, parent=xrow)
+                for resource_index, resource_bp in enumerate(scan_bp.resources):
+                    # Each resource is staged in its own subdirectory of a single
+                    # temporary directory that is cleaned up afterwards
+                    tmp_dir = Path(tmp_root) / f"{scan_id}-{resource_index}"
+                    tmp_dir.mkdir()
+                    # Create the resource
+                    xresource = xscan.create_resource(resource_bp.path)
+                    # Create the dummy files
+                    item = resource_bp.make_item(
+                        source_data=source_data,
+                        source_fallback=True,
+                        escape_source_name=False,
+                    )
+                    item.copy(tmp_dir)
+                    xresource.upload_dir(tmp_dir)
 
 
 __all__ = ["TestXnatDatasetBlueprint", "ScanBlueprint"]
@@ -4,13 +4,17 @@ import os.path
 import operator as op
 import shutil
 import logging
+import hashlib
 from pathlib import Path
-from functools import reduce
+from types import SimpleNamespace
+from functools import reduce, lru_cache
 import itertools
+import attrs
 import pytest
 from pydra.utils.hash import hash_object
 from fileformats.generic import File
 from fileformats.field import Text as TextField
+from fileformats.medimage import DicomSeries
 from frametree.common import Clinical
 from frametree.core.frameset import FrameSet
 from frametree.xnat import XnatViaCS
@@ -25,11 +29,20 @@ else:
     from pwd import getpwuid
     from grp import getgrgid
 
+    # User/group lookups can go out to NSS/LDAP, so only look up each ID once
+    @lru_cache(maxsize=256)
+    def user_name(uid):
+        return getpwuid(uid).pw_name
+
+    @lru_cache(maxsize=256)
+    def group_name(gid):
+        return getgrgid(gid).gr_name
+
     def get_perms(f):
         st = os.stat(f)
         return (
-            getpwuid(st.st_uid).pw_name,
-            getgrgid(st.st_gid).gr_name,
+            user_name(st.st_uid),
+            group_name(st.st_gid),
             oct(st.st_mode),
         )
 
@@ -54,20 +67,80 @@ def test_populate_tree(static_dataset: FrameSet):
         )
 
 
+def test_populate_tree_metadata(static_dataset: FrameSet):
+    store = static_dataset.store
+    leaves = {}
+
+    def add_leaf(tree_path, metadata):
+        leaves[tuple(tree_path)] = metadata["session"]
+
+    store.populate_tree(
+        SimpleNamespace(dataset_id=static_dataset.id, add_leaf=add_leaf)
+    )
+    expected = {}
+    with store.connection:
+        for xsubject in store.connection.projects[static_dataset.id].subjects.values():
+            for xsess in xsubject.experiments.values():
+                expected[(xsubject.label, xsess.label)] = {
+                    "date": xsess.date.strftime("%Y%m%d") if xsess.date else None,
+                    "visit_id": xsess.visit_id,
+                    "age": xsess.age,
+                    "modality": xsess.modality,
+                }
+    assert leaves == expected
+
+
 def test_populate_row(static_dataset: FrameSet):
     blueprint = static_dataset.__annotations__["blueprint"]
-    for row in static_dataset.rows("session"):
-        expected_entries = sorted(
-            itertools.chain(
-                *(
-                    [f"{scan_bp.name}/{res_bp.path}" for res_bp in scan_bp.resources]
-                    for scan_bp in blueprint.scans
-                )
+    expected_entries = sorted(
+        itertools.chain(
+            *(
+                [f"{scan_bp.name}/{res_bp.path}" for res_bp in scan_bp.resources]
+                for scan_bp in blueprint.scans
             )
         )
+    )
+    for row in static_dataset.rows("session"):
         assert sorted(e.path for e in row.entries) == expected_entries
 
 
+def test_dicom_header_cache(static_dataset: FrameSet, monkeypatch):
+    store = static_dataset.store
+    # The header is downloaded per scan, so only take one DICOM resource of each
+    scan_uris = {
+        e.uri.rsplit("/resources/", 1)[0]: e.uri
+        for row in static_dataset.rows("session")
+        for e in row.entries
+        if e.datatype is DicomSeries
+    }
+    assert scan_uris
+    with store.connection:
+        headers = {uri: store._get_dicom_header(uri) for uri in scan_uris.values()}
+        requested = []
+        get = store.connection.session.get
+
+        def spy_get(path, *args, **kwargs):
+            requested.append(path)
+            return get(path, *args, **kwargs)
+
+        def check_headers(version, expected_requests):
+            requested.clear()
+            for uri, header in headers.items():
+                assert store._get_dicom_header(uri, version=version) == header
+            assert len(requested) == expected_requests
+
+        with monkeypatch.context() as m:
+            m.setattr(store.connection.session, "get", spy_get)
+            # The first request with a version token caches the header
+            check_headers("v1", len(headers))
+            # Cached headers (with tuple keys) are read back without querying the
+            # server
+            check_headers("v1", 0)
+            # A new version token invalidates the cached header
+            check_headers("v2", len(headers))
+            check_headers("v2", 0)
+
+
 def test_get(static_dataset: FrameSet, caplog):
     blueprint = static_dataset.__annotations__["blueprint"]
     expected_files = {}
@@ -128,6 +201,11 @@ def test_post(dataset: FrameSet, source_data: Path, caplog):
         # else:
         #     relative_to = deriv_tmp_dir
         all_checksums[deriv_bp.path] = item.hash_files()
+        # Check that the MD5 digests calculated by the store match those calculated
+        # by fileformats
+        assert dataset.store.calculate_checksums(item) == item.hash_files(
+            crypto=hashlib.md5, relative_to=item.fspath.parent
+        )
         # Insert into first row of that row_frequency in dataset
         row = next(iter(dataset.rows(deriv_bp.row_frequency)))
         with caplog.at_level(logging.INFO, logger="frametree"):
@@ -152,6 +230,30 @@ def test_post(dataset: FrameSet, source_data: Path, caplog):
         check_inserted()
 
 
+def test_lazy_row_checksums(simple_dataset: FrameSet, monkeypatch, tmp_path: Path):
+    store = simple_dataset.store
+    row = next(iter(simple_dataset.rows("session")))
+    fspath = tmp_path / "file.txt"
+    fspath.write_text("lazily downloaded checksums")
+    with store.connection:
+        store.get_xrow(row).create_resource("LAZY").upload(str(fspath), fspath.name)
+        requested = []
+        get = store.connection.session.get
+
+        def spy_get(path, *args, **kwargs):
+            requested.append(path)
+            return get(path, *args, **kwargs)
+
+        with monkeypatch.context() as m:
+            m.setattr(store.connection.session, "get", spy_get)
+            entry = row.entry("LAZY")
+            assert not [p for p in requested if p.endswith("/files")]
+            assert dict(entry.checksums) == {
+                fspath.name: hashlib.md5(fspath.read_bytes()).hexdigest()
+            }
+            assert len([p for p in requested if p.endswith("/files")]) == 1
+
+
 def test_frameset_roundtrip(simple_dataset: FrameSet):
     definition = asdict(simple_dataset, omit=["store", "name"])
     definition["store-version"] = "1.0.0"
@@ -182,6 +284,18 @@ def test_provenance_roundtrip(datatype: type, value: str, simple_dataset: FrameS
         assert provenance == reloaded_provenance
 
 
+def test_store_clone(static_dataset: FrameSet):
+    # Stores are copied by passing their attributes back to the constructor (e.g. in
+    # RemoteStore.site_licenses_dataset), which has to work while rows are cached
+    store = static_dataset.store
+    with store.connection:
+        for row in static_dataset.rows("session"):
+            store.get_xrow(row)
+        kwargs = attrs.asdict(store, recurse=False)
+        del kwargs["connection"]
+        assert type(store)(**kwargs) == store
+
+
 def test_dataset_bytes_hash(static_dataset):
 
     hsh = hash_object(static_dataset)